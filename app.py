@@ -5,8 +5,10 @@ import numpy as np
 import base64
 import json
 import os
+import threading
+import time
 from datetime import datetime
-from collections import deque
+from collections import deque, OrderedDict
 
 app = Flask(__name__)
 
@@ -144,8 +146,164 @@ class WebEmotionAvatar:
         
         return emotion_data
 
-# Global instance
+class EmotionStatistics:
+    """Running emotion statistics updated in O(1) per frame"""
+    def __init__(self, emotions, max_gap=2.0):
+        self.emotions = list(emotions)
+        self.max_gap = max_gap
+        self.frames = 0
+        self.face_frames = 0
+        self.confidence_sum = 0.0
+        self.counts = {emotion: 0 for emotion in self.emotions}
+        self.dwell_time = {emotion: 0.0 for emotion in self.emotions}
+        self.transitions = {src: {dst: 0 for dst in self.emotions} for src in self.emotions}
+        self.current_emotion = None
+        self.last_emotion = None
+        self.last_time = None
+        self.started_at = time.time()
+
+    def update(self, emotion, confidence, face_detected, timestamp):
+        """Fold a frame of this stream in and return its (dwell, transition) increments"""
+        dwell = None
+        transition = None
+
+        # Credit the elapsed time to the emotion shown since the last frame,
+        # ignoring gaps long enough to mean the stream was paused
+        if self.last_emotion is not None:
+            gap = timestamp - self.last_time
+            if 0 < gap <= self.max_gap:
+                dwell = (self.last_emotion, gap)
+            if face_detected and self.last_emotion != emotion:
+                transition = (self.last_emotion, emotion)
+
+        self.apply(emotion, confidence, face_detected, dwell, transition)
+        self.last_emotion = emotion if face_detected else None
+        self.last_time = timestamp
+        return dwell, transition
+
+    def apply(self, emotion, confidence, face_detected, dwell=None, transition=None):
+        """Add one frame and precomputed dwell/transition increments"""
+        self.frames += 1
+        if dwell is not None:
+            self.dwell_time[dwell[0]] += dwell[1]
+        if transition is not None:
+            self.transitions[transition[0]][transition[1]] += 1
+
+        if not face_detected:
+            self.current_emotion = None
+            return
+
+        self.face_frames += 1
+        self.confidence_sum += confidence
+        self.counts[emotion] += 1
+        self.current_emotion = emotion
+
+    def snapshot(self):
+        """Return the statistics as a JSON-serializable dict"""
+        return {
+            'frames': self.frames,
+            'face_frames': self.face_frames,
+            'face_detected_rate': round(self.face_frames / self.frames, 4) if self.frames else 0.0,
+            'mean_confidence': round(self.confidence_sum / self.face_frames, 4) if self.face_frames else 0.0,
+            'counts': dict(self.counts),
+            'dwell_time': {emotion: round(t, 3) for emotion, t in self.dwell_time.items()},
+            'transitions': {src: dict(dst) for src, dst in self.transitions.items()},
+            'current_emotion': self.current_emotion,
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat()
+        }
+
+class StatsAggregator:
+    """Global and per-session statistics shared with stats subscribers"""
+    def __init__(self, emotions, max_sessions=100, max_subscribers=4):
+        self.emotions = list(emotions)
+        self.max_sessions = max_sessions
+        self.max_subscribers = max_subscribers
+        self.global_stats = EmotionStatistics(self.emotions)
+        # Frames without a session id form their own stream so they do not
+        # create transitions against other users' frames
+        self.anonymous_stats = EmotionStatistics(self.emotions)
+        self.sessions = OrderedDict()
+        self.subscribers = 0
+        self.version = 0
+        self.condition = threading.Condition()
+        self._cached_version = -1
+        self._cached_payload = None
+
+    def record(self, emotion_data, session_id=None):
+        """Update session and global statistics for one processed frame"""
+        timestamp = time.time()
+        emotion = emotion_data['emotion']
+        confidence = emotion_data['confidence']
+        face_detected = emotion_data['face_detected']
+
+        with self.condition:
+            if session_id:
+                session = self.sessions.get(session_id)
+                if session is None:
+                    session = EmotionStatistics(self.emotions)
+                    self.sessions[session_id] = session
+                    # Evict the least recently active session
+                    if len(self.sessions) > self.max_sessions:
+                        self.sessions.popitem(last=False)
+                else:
+                    self.sessions.move_to_end(session_id)
+            else:
+                session = self.anonymous_stats
+
+            # Global dwell time and transitions are the sum of per-session increments
+            dwell, transition = session.update(emotion, confidence, face_detected, timestamp)
+            self.global_stats.apply(emotion, confidence, face_detected, dwell, transition)
+            self.version += 1
+            self.condition.notify_all()
+
+    def snapshot(self, session_id=None):
+        """Return global statistics, or a single session's if requested"""
+        with self.condition:
+            if session_id:
+                session = self.sessions.get(session_id)
+                return session.snapshot() if session else None
+            return {
+                'global': self.global_stats.snapshot(),
+                'active_sessions': len(self.sessions)
+            }
+
+    def payload(self):
+        """Return the serialized global snapshot, rebuilt at most once per update"""
+        with self.condition:
+            if self._cached_version != self.version:
+                self._cached_payload = json.dumps(self.snapshot())
+                self._cached_version = self.version
+            return self._cached_version, self._cached_payload
+
+    def wait_for_update(self, last_version, timeout):
+        """Block until statistics change past last_version or timeout elapses"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != last_version, timeout=timeout)
+            return self.version
+
+    def subscribe(self):
+        """Reserve a stream slot, returning False once the cap is reached"""
+        with self.condition:
+            if self.subscribers >= self.max_subscribers:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self.condition:
+            self.subscribers -= 1
+
+def clean_session_id(session_id, max_length=64):
+    """Accept only short string session ids, otherwise treat the frame as anonymous"""
+    if isinstance(session_id, str) and 0 < len(session_id) <= max_length:
+        return session_id
+    return None
+
+# Global instances
 avatar = WebEmotionAvatar()
+stats_aggregator = StatsAggregator(avatar.emotions.keys())
+# FaceMesh tracking and the avatar's history are not thread-safe
+avatar_lock = threading.Lock()
 
 @app.route('/')
 def index():
@@ -175,7 +333,9 @@ def process_frame():
         frame = cv2.resize(frame, (320, 240))
         
         # Process frame
-        emotion_data = avatar.process_frame(frame)
+        with avatar_lock:
+            emotion_data = avatar.process_frame(frame)
+        stats_aggregator.record(emotion_data, clean_session_id(data.get('session_id')))
         
         return jsonify(emotion_data)
     
@@ -199,6 +359,50 @@ def get_stats():
     }
     return jsonify(stats)
 
+@app.route('/api/stats/aggregate')
+def get_aggregate_stats():
+    """Get aggregated statistics, globally or for one session"""
+    session_id = request.args.get('session_id')
+    if session_id:
+        stats = stats_aggregator.snapshot(session_id)
+        if stats is None:
+            return jsonify({'error': 'Unknown session'}), 404
+        return jsonify(stats)
+    _, payload = stats_aggregator.payload()
+    return Response(payload, mimetype='application/json')
+
+@app.route('/api/stats/stream')
+def stream_stats():
+    """Server-sent events stream of aggregated statistics"""
+    min_interval = 0.5
+    keepalive = 15.0
+    max_duration = 300.0
+
+    # Each stream holds a worker thread, so cap them to keep frame processing responsive
+    if not stats_aggregator.subscribe():
+        return jsonify({'error': 'Too many stats subscribers'}), 503
+
+    def generate():
+        # Close periodically so threads are recycled; EventSource reconnects
+        deadline = time.time() + max_duration
+        last_version = -1
+        yield "retry: 5000\n\n"
+        while time.time() < deadline:
+            version, payload = stats_aggregator.payload()
+            if version != last_version:
+                last_version = version
+                yield f"data: {payload}\n\n"
+                # Rate limit pushes so subscribers never track every frame
+                time.sleep(min_interval)
+            elif stats_aggregator.wait_for_update(last_version, keepalive) == last_version:
+                yield ": keepalive\n\n"
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the stream, including on client disconnect
+    response.call_on_close(stats_aggregator.unsubscribe)
+    return response
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for Vercel"""
@@ -3,9 +3,129 @@ import mediapipe as mp
 import numpy as np
 import time
 import os
+import queue
+import threading
 from collections import deque
 from datetime import datetime
 
+class MediaWriter:
+    """Background writer for screenshots and recordings"""
+    def __init__(self, output_dir="screenshots", max_queue=64, fps=30):
+        self.output_dir = output_dir
+        self.fps = fps
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped_screenshots = 0
+        self.dropped_frames = 0
+        self.recording = False
+        self.video_filename = None
+        self.video_writer = None
+        self._active_filename = None
+        self._active_fps = fps
+        self._open_failed = False
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _submit(self, job):
+        """Queue a job without blocking, returning False if the queue is full"""
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except queue.Full:
+            return False
+
+    def save_screenshot(self, frame, avatar_frame):
+        """Queue a side-by-side screenshot"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = os.path.join(self.output_dir, f"emotion_avatar_{timestamp}.jpg")
+        if self._submit(("screenshot", filename, None, frame.copy(), avatar_frame.copy())):
+            print(f"Screenshot queued: {filename}")
+        else:
+            self.dropped_screenshots += 1
+            print("Screenshot dropped: writer queue full")
+
+    def start_recording(self, fps=None):
+        """Start recording a side-by-side clip at the given frame rate"""
+        if self.recording:
+            self.stop_recording()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = os.path.join(self.output_dir, f"emotion_avatar_{timestamp}.mp4")
+        fps = fps if fps and fps >= 1 else self.fps
+        self.recording = True
+        self.video_filename = filename
+        self.dropped_frames = 0
+        # Markers must not be dropped or frames would land in the wrong file
+        self.queue.put(("start", filename, fps, None, None))
+        print(f"Recording started: {filename} ({fps:.1f} fps)")
+
+    def stop_recording(self):
+        """Stop the current recording"""
+        if not self.recording:
+            return
+        self.recording = False
+        self.queue.put(("stop", None, None, None, None))
+        print(f"Recording stopped: {self.video_filename} (dropped frames: {self.dropped_frames})")
+
+    def add_frame(self, frame, avatar_frame):
+        """Queue a frame for the active recording"""
+        if self.recording:
+            if not self._submit(("frame", None, None, frame.copy(), avatar_frame.copy())):
+                self.dropped_frames += 1
+
+    def _worker(self):
+        """Encode and write queued jobs off the render loop"""
+        while True:
+            kind, filename, fps, frame, avatar_frame = self.queue.get()
+            try:
+                if kind == "close":
+                    break
+                elif kind == "screenshot":
+                    cv2.imwrite(filename, np.hstack([frame, avatar_frame]))
+                    print(f"Screenshot saved: {filename}")
+                elif kind == "start":
+                    self._release_video()
+                    self._active_filename = filename
+                    self._active_fps = fps
+                    self._open_failed = False
+                elif kind == "frame":
+                    self._write_frame(np.hstack([frame, avatar_frame]))
+                elif kind == "stop":
+                    self._release_video()
+                    self._active_filename = None
+            except Exception as e:
+                print(f"❌ Writer error: {e}")
+            finally:
+                self.queue.task_done()
+        self._release_video()
+
+    def _write_frame(self, combined):
+        if self._active_filename is None or self._open_failed:
+            return
+        if self.video_writer is None:
+            h, w = combined.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            writer = cv2.VideoWriter(self._active_filename, fourcc, self._active_fps, (w, h))
+            if not writer.isOpened():
+                self._open_failed = True
+                print(f"❌ Error: Could not open video writer for {self._active_filename}")
+                return
+            self.video_writer = writer
+        self.video_writer.write(combined)
+
+    def _release_video(self):
+        if self.video_writer is not None:
+            self.video_writer.release()
+            self.video_writer = None
+
+    def close(self):
+        """Flush pending jobs and stop the writer thread"""
+        self.stop_recording()
+        self.queue.put(("close", None, None, None, None))
+        self.thread.join()
+        if self.dropped_screenshots:
+            print(f"Media writer dropped {self.dropped_screenshots} screenshots")
+
 class EmotionAvatar:
     def __init__(self):
         # Mediapipe setup
@@ -42,8 +162,8 @@ class EmotionAvatar:
         self.show_debug = False
         self.avatar_style = "mesh"
         
-        # Create screenshots directory
-        os.makedirs("screenshots", exist_ok=True)
+        # Background writer for screenshots and recordings
+        self.media_writer = MediaWriter("screenshots")
 
     def distance(self, p1, p2):
         return np.linalg.norm(np.array([p1.x, p1.y]) - np.array([p2.x, p2.y]))
@@ -172,22 +292,26 @@ class EmotionAvatar:
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 100), 2)
         
         # Controls info
-        controls_text = "ESC: Quit | S: Screenshot | D: Debug | A: Avatar Style"
+        controls_text = "ESC: Quit | S: Screenshot | R: Record | D: Debug | A: Avatar Style"
         cv2.putText(frame, controls_text, (10, frame.shape[0] - 20), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (150, 150, 150), 1)
 
     def take_screenshot(self, frame, avatar_frame):
         """Take a screenshot"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"screenshots/emotion_avatar_{timestamp}.jpg"
-        combined = np.hstack([frame, avatar_frame])
-        cv2.imwrite(filename, combined)
-        print(f"Screenshot saved: {filename}")
+        self.media_writer.save_screenshot(frame, avatar_frame)
+
+    def toggle_recording(self):
+        """Start or stop continuous recording"""
+        if self.media_writer.recording:
+            self.media_writer.stop_recording()
+        else:
+            # Record at the measured loop rate so clips play back in real time
+            self.media_writer.start_recording(self.avg_fps)
 
     def run(self):
         """Main application loop"""
         print("🎭 Real-Time Emotion Avatar")
-        print("Controls: ESC=Quit, S=Screenshot, D=Debug, A=Avatar Style")
+        print("Controls: ESC=Quit, S=Screenshot, R=Record, D=Debug, A=Avatar Style")
         print()
         
         cap = cv2.VideoCapture(0)
@@ -242,6 +366,9 @@ class EmotionAvatar:
                 self.draw_ui(frame, emotion, self.avg_fps)
                 self.draw_ui(avatar_canvas, emotion, self.avg_fps)
                 
+                # Queue frame for recording
+                self.media_writer.add_frame(frame, avatar_canvas)
+                
                 # Display windows
                 cv2.imshow("Webcam Feed", cv2.resize(frame, (640, 480)))
                 cv2.imshow("Emotion Avatar", cv2.resize(avatar_canvas, (640, 480)))
@@ -252,6 +379,8 @@ class EmotionAvatar:
                     break
                 elif key == ord('s'):  # Screenshot
                     self.take_screenshot(frame, avatar_canvas)
+                elif key == ord('r'):  # Toggle recording
+                    self.toggle_recording()
                 elif key == ord('d'):  # Toggle debug
                     self.show_debug = not self.show_debug
                     print(f"Debug mode: {'ON' if self.show_debug else 'OFF'}")
@@ -266,6 +395,7 @@ class EmotionAvatar:
             print(f"❌ Error: {e}")
         finally:
             cap.release()
+            self.media_writer.close()
             cv2.destroyAllWindows()
             print("👋 Goodbye!")
 
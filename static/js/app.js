@@ -24,6 +24,7 @@ class EmotionAvatarApp {
         this.processingInterval = null;
         this.emotionHistory = [];
         this.lastEmotion = null;
+        this.sessionId = null;
         
         // Initialize
         this.init();
@@ -53,6 +54,7 @@ class EmotionAvatarApp {
             });
             
             this.video.srcObject = this.stream;
+            this.sessionId = Date.now().toString(36) + Math.random().toString(36).slice(2);
             this.video.play();
             
             this.video.addEventListener('loadedmetadata', () => {
@@ -113,7 +115,7 @@ class EmotionAvatarApp {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ image: imageData })
+                body: JSON.stringify({ image: imageData, session_id: this.sessionId })
             });
             
             if (!response.ok) {